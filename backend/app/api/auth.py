@@ -2,21 +2,39 @@
 Authentication API - UISP Integration
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from cachetools import TLRUCache, TTLCache
+import asyncio
+import hashlib
+import time
 import jwt
-import httpx
 import structlog
 from typing import Optional
 
 from app.core.config import settings
+from app.api.http_clients import uisp_client
 from app.core.database import get_db, Customer
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.postgresql import insert
 
 router = APIRouter()
 logger = structlog.get_logger()
+# auto_error=False: FastAPI's own rejection is a 403, we answer missing credentials with 401
+security = HTTPBearer(auto_error=False)
+
+# Seconds a verified token is trusted before it is decoded again
+JWT_CACHE_TTL = 30
+
+# Our tokens carry no audience, only an expiry
+JWT_DECODE_OPTIONS = {"verify_aud": False, "require": ["exp"]}
+
+# Signing key as bytes, resolved once instead of per token
+_signing_key = settings.SECRET_KEY.encode()
+_algorithms = [settings.JWT_ALGORITHM]
 
 
 class LoginRequest(BaseModel):
@@ -36,6 +54,19 @@ class TokenPayload(BaseModel):
     uisp_customer_id: str
     email: str
     exp: datetime
+    uisp_token: Optional[str] = None
+
+
+def _token_cache_expiry(key: bytes, payload: TokenPayload, now: float) -> float:
+    """Expire cached tokens after JWT_CACHE_TTL or at token expiry, whichever is first"""
+    return min(now + JWT_CACHE_TTL, payload.exp.timestamp())
+
+
+# Verified tokens, keyed by token digest so raw bearers are never held in memory
+_jwt_cache = TLRUCache(maxsize=10000, ttu=_token_cache_expiry, timer=time.time)
+
+# UISP customer ID -> local customer ID, skips the lookup on repeat logins
+_customer_id_cache = TTLCache(maxsize=10000, ttl=300)
 
 
 def create_access_token(data: dict) -> str:
@@ -43,19 +74,39 @@ def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(hours=settings.JWT_EXPIRATION_HOURS)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    return jwt.encode(to_encode, _signing_key, algorithm=_algorithms[0])
 
 
-async def verify_token(authorization: str = Header(...)) -> TokenPayload:
+async def verify_token(
+    creds: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> TokenPayload:
     """Verify JWT token from Authorization header"""
+    if creds is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    
+    token = creds.credentials
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    
+    cached = _jwt_cache.get(key)
+    if cached is not None:
+        return cached
+    
     try:
-        token = authorization.replace("Bearer ", "")
         payload = jwt.decode(
             token, 
-            settings.SECRET_KEY, 
-            algorithms=[settings.JWT_ALGORITHM]
+            _signing_key, 
+            algorithms=_algorithms,
+            options=JWT_DECODE_OPTIONS
         )
-        return TokenPayload(**payload)
+        # Signature already verified and we minted the claims, skip validation
+        payload["exp"] = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+        token_payload = TokenPayload.model_construct(**payload)
+        _jwt_cache[key] = token_payload
+        return token_payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
@@ -66,58 +117,58 @@ class UISPService:
     """UISP API Integration Service"""
     
     def __init__(self):
-        self.base_url = settings.UISP_URL.rstrip('/')
         self.api_key = settings.UISP_API_KEY
     
     async def authenticate(self, username: str, password: str) -> dict:
         """Authenticate user against UISP"""
-        async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-            # Method 1: Try session-based login
-            response = await client.post(
-                f"{self.base_url}/api/v2.1/user/login",
-                json={"username": username, "password": password}
+        # Method 1: Try session-based login
+        response = await uisp_client.post(
+            "/user/login",
+            json={"username": username, "password": password}
+        )
+        
+        if response.status_code == 200:
+            token = response.headers.get('x-auth-token')
+            
+            # Get user/customer info
+            user_response = await uisp_client.get(
+                "/user",
+                headers={"x-auth-token": token}
             )
             
-            if response.status_code == 200:
-                token = response.headers.get('x-auth-token')
+            if user_response.status_code == 200:
+                user_data = user_response.json()
                 
-                # Get user/customer info
-                user_response = await client.get(
-                    f"{self.base_url}/api/v2.1/user",
-                    headers={"x-auth-token": token}
-                )
-                
-                if user_response.status_code == 200:
-                    user_data = user_response.json()
-                    
-                    # Get customer details if this is a client user
-                    customer_id = user_data.get('clientId')
-                    if customer_id:
-                        customer = await self.get_customer(client, token, customer_id)
-                        services = await self.get_customer_services(client, token, customer_id)
-                        return {
-                            "token": token,
-                            "user": user_data,
-                            "customer": customer,
-                            "services": services
-                        }
-            
-            raise HTTPException(status_code=401, detail="Invalid UISP credentials")
+                # Get customer details if this is a client user
+                customer_id = user_data.get('clientId')
+                if customer_id:
+                    customer, services = await asyncio.gather(
+                        self.get_customer(token, customer_id),
+                        self.get_customer_services(token, customer_id)
+                    )
+                    return {
+                        "token": token,
+                        "user": user_data,
+                        "customer": customer,
+                        "services": services
+                    }
+        
+        raise HTTPException(status_code=401, detail="Invalid UISP credentials")
     
-    async def get_customer(self, client: httpx.AsyncClient, token: str, customer_id: str) -> dict:
+    async def get_customer(self, token: str, customer_id: str) -> dict:
         """Get customer details from UISP"""
-        response = await client.get(
-            f"{self.base_url}/api/v2.1/clients/{customer_id}",
+        response = await uisp_client.get(
+            f"/clients/{customer_id}",
             headers={"x-auth-token": token}
         )
         if response.status_code == 200:
             return response.json()
         return {}
     
-    async def get_customer_services(self, client: httpx.AsyncClient, token: str, customer_id: str) -> list:
+    async def get_customer_services(self, token: str, customer_id: str) -> list:
         """Get customer services from UISP"""
-        response = await client.get(
-            f"{self.base_url}/api/v2.1/clients/{customer_id}/services",
+        response = await uisp_client.get(
+            f"/clients/{customer_id}/services",
             headers={"x-auth-token": token}
         )
         if response.status_code == 200:
@@ -126,29 +177,41 @@ class UISPService:
     
     async def get_invoices(self, token: str, customer_id: str) -> list:
         """Get customer invoices from UISP"""
-        async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/api/v2.1/clients/{customer_id}/invoices",
-                headers={"x-auth-token": token}
-            )
-            if response.status_code == 200:
-                return response.json()
-            return []
+        response = await uisp_client.get(
+            f"/clients/{customer_id}/invoices",
+            headers={"x-auth-token": token}
+        )
+        if response.status_code == 200:
+            return response.json()
+        return []
     
     async def get_payments(self, token: str, customer_id: str) -> list:
         """Get customer payments from UISP"""
-        async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/api/v2.1/clients/{customer_id}/payments",
-                headers={"x-auth-token": token}
-            )
-            if response.status_code == 200:
-                return response.json()
-            return []
+        response = await uisp_client.get(
+            f"/clients/{customer_id}/payments",
+            headers={"x-auth-token": token}
+        )
+        if response.status_code == 200:
+            return response.json()
+        return []
 
 
 uisp_service = UISPService()
 
+# Login upsert, built once so every login hits SQLAlchemy's compiled cache
+_customer_insert = insert(Customer).values(
+    uisp_customer_id=bindparam("uid"),
+    email=bindparam("customer_email"),
+    name=bindparam("customer_name"),
+    phone=bindparam("customer_phone"),
+)
+# Existing customers are left untouched (no email rewrite that could hit the unique
+# constraint, no updated_at bump); the no-op update only makes RETURNING yield their id
+_UPSERT_CUSTOMER = _customer_insert.on_conflict_do_update(
+    index_elements=[Customer.uisp_customer_id],
+    set_={"uisp_customer_id": _customer_insert.excluded.uisp_customer_id},
+).returning(Customer.id)
+
 
 @router.post("/login", response_model=LoginResponse)
 async def login(request: LoginRequest, db: AsyncSession = Depends(get_db)):
@@ -162,36 +225,31 @@ async def login(request: LoginRequest, db: AsyncSession = Depends(get_db)):
         auth_result = await uisp_service.authenticate(request.username, request.password)
         
         uisp_customer_id = str(auth_result["customer"].get("id", ""))
-        email = auth_result["user"].get("email", request.username)
-        
-        # Check if customer exists in our database
-        result = await db.execute(
-            select(Customer).where(Customer.uisp_customer_id == uisp_customer_id)
-        )
-        customer = result.scalar_one_or_none()
+        # UISP may return a null email; NOT NULL is enforced even when the upsert conflicts
+        email = auth_result["user"].get("email") or request.username
         
-        # Create customer if not exists
-        if not customer:
-            customer = Customer(
-                uisp_customer_id=uisp_customer_id,
-                email=email,
-                name=f"{auth_result['customer'].get('firstName', '')} {auth_result['customer'].get('lastName', '')}".strip(),
-                phone=auth_result['customer'].get('phone', ''),
-            )
-            db.add(customer)
+        # Look up customer (cache first, then upsert in a single round-trip)
+        customer_id = _customer_id_cache.get(uisp_customer_id)
+        if customer_id is None:
+            result = await db.execute(_UPSERT_CUSTOMER, {
+                "uid": uisp_customer_id,
+                "customer_email": email,
+                "customer_name": f"{auth_result['customer'].get('firstName', '')} {auth_result['customer'].get('lastName', '')}".strip(),
+                "customer_phone": auth_result['customer'].get('phone', ''),
+            })
+            customer_id = result.scalar_one()
             await db.commit()
-            await db.refresh(customer)
-            logger.info("New customer created", customer_id=customer.id)
+            _customer_id_cache[uisp_customer_id] = customer_id
         
         # Create our JWT token
         access_token = create_access_token({
-            "customer_id": customer.id,
+            "customer_id": customer_id,
             "uisp_customer_id": uisp_customer_id,
             "email": email,
             "uisp_token": auth_result["token"],  # Store UISP token for API calls
         })
         
-        logger.info("Login successful", customer_id=customer.id)
+        logger.info("Login successful", customer_id=customer_id)
         
         return LoginResponse(
             access_token=access_token,
@@ -227,5 +285,6 @@ async def refresh_token(token: TokenPayload = Depends(verify_token)):
         "customer_id": token.customer_id,
         "uisp_customer_id": token.uisp_customer_id,
         "email": token.email,
+        "uisp_token": token.uisp_token,
     })
     return {"access_token": new_token, "token_type": "bearer"}
@@ -6,13 +6,15 @@ Auto-detect connected network devices (Starlink, MikroTik, TR-069)
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional
+from cachetools import TTLCache
 import asyncio
-import socket
+import re
 import httpx
+import orjson
 import structlog
 
 from app.api.auth import verify_token, TokenPayload
-from app.core.config import settings
+from app.api.http_clients import genieacs_client
 
 router = APIRouter()
 logger = structlog.get_logger()
@@ -31,18 +33,48 @@ class DeviceInfo(BaseModel):
     capabilities: list = []
 
 
+# HTTP fingerprint markers -> (device_type, manufacturer, capabilities)
+FINGERPRINTS = {
+    "tp-link": ("tr069", "TP-Link", ("wifi_config", "status", "reboot")),
+    "d-link": ("tr069", "D-Link", ("wifi_config", "status", "reboot")),
+    "asuswrt": ("asus", "ASUS", ("wifi_config", "status")),
+    "asus": ("asus", "ASUS", ("wifi_config", "status")),
+    "ubnt": ("ubiquiti", "Ubiquiti", ("status",)),
+    "ubiquiti": ("ubiquiti", "Ubiquiti", ("status",)),
+    "unifi": ("ubiquiti", "Ubiquiti", ("status",)),
+}
+FINGERPRINT_PATTERN = re.compile("|".join(re.escape(marker) for marker in FINGERPRINTS))
+
+# Markers sit in the page head, no need to scan the whole admin page
+FINGERPRINT_SCAN_BYTES = 16384
+
+
+# Recent probe results, (host, port) -> open
+_port_cache = TTLCache(maxsize=1024, ttl=10)
+
+
 async def check_port(host: str, port: int, timeout: float = 2.0) -> bool:
-    """Check if a port is open on a host"""
+    """Check if a port is open on a host (results cached briefly)"""
+    key = (host, port)
+    is_open = _port_cache.get(key)
+    if is_open is not None:
+        return is_open
+    
+    is_open = await _probe_port(host, port, timeout)
+    _port_cache[key] = is_open
+    return is_open
+
+
+async def _probe_port(host: str, port: int, timeout: float) -> bool:
+    """Attempt a TCP connection to host:port"""
     try:
-        loop = asyncio.get_event_loop()
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        result = await loop.run_in_executor(
-            None, 
-            lambda: sock.connect_ex((host, port))
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port),
+            timeout
         )
-        sock.close()
-        return result == 0
+        writer.close()
+        await writer.wait_closed()
+        return True
     except Exception:
         return False
 
@@ -66,15 +98,18 @@ async def detect_starlink(ip: str) -> Optional[DeviceInfo]:
 
 async def detect_mikrotik(ip: str) -> Optional[DeviceInfo]:
     """Detect MikroTik router at the given IP"""
-    # Check RouterOS API port (8728) or WinBox port (8291)
-    api_port_open = await check_port(ip, 8728)
-    winbox_port_open = await check_port(ip, 8291)
+    # Check RouterOS API port (8728) or WinBox port (8291), plus HTTP (80)
+    api_port_open, winbox_port_open, http_port_open = await asyncio.gather(
+        check_port(ip, 8728),
+        check_port(ip, 8291),
+        check_port(ip, 80)
+    )
     
     if api_port_open or winbox_port_open:
         capabilities = ["wifi_config", "status", "reboot"]
         
         # Check if hotspot is likely available (check for port 80)
-        if await check_port(ip, 80):
+        if http_port_open:
             capabilities.extend(["hotspot_users", "hotspot_vouchers", "hotspot_profiles"])
         
         return DeviceInfo(
@@ -89,29 +124,29 @@ async def detect_mikrotik(ip: str) -> Optional[DeviceInfo]:
 async def detect_tr069_device(ip: str) -> Optional[DeviceInfo]:
     """Check GenieACS for TR-069 devices with this IP"""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            # Search GenieACS for device by IP
-            response = await client.get(
-                f"{settings.GENIEACS_URL}/devices",
-                params={
-                    "query": f'{{"InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANIPConnection.1.ExternalIPAddress":"{ip}"}}'
-                }
-            )
-            
-            if response.status_code == 200:
-                devices = response.json()
-                if devices:
-                    device = devices[0]
-                    device_id = device.get("_deviceId", {})
-                    
-                    return DeviceInfo(
-                        device_type="tr069",
-                        manufacturer=device_id.get("_Manufacturer", "Unknown"),
-                        model=device_id.get("_ProductClass", "Unknown"),
-                        device_id=device.get("_id"),
-                        ip_address=ip,
-                        capabilities=["wifi_config", "status", "reboot", "firmware_update"]
-                    )
+        # Search GenieACS for device by IP
+        response = await genieacs_client.get(
+            "/devices",
+            params={
+                "query": f'{{"InternetGatewayDevice.WANDevice.1.WANConnectionDevice.1.WANIPConnection.1.ExternalIPAddress":"{ip}"}}'
+            },
+            timeout=5.0
+        )
+        
+        if response.status_code == 200:
+            devices = orjson.loads(response.content)
+            if devices:
+                device = devices[0]
+                device_id = device.get("_deviceId", {})
+                
+                return DeviceInfo(
+                    device_type="tr069",
+                    manufacturer=device_id.get("_Manufacturer", "Unknown"),
+                    model=device_id.get("_ProductClass", "Unknown"),
+                    device_id=device.get("_id"),
+                    ip_address=ip,
+                    capabilities=["wifi_config", "status", "reboot", "firmware_update"]
+                )
     except Exception as e:
         logger.warning("TR-069 detection failed", error=str(e))
     
@@ -122,46 +157,26 @@ async def detect_by_http_fingerprint(ip: str) -> Optional[DeviceInfo]:
     """Try to identify device by HTTP response fingerprint"""
     try:
         async with httpx.AsyncClient(timeout=3.0, verify=False) as client:
-            response = await client.get(f"http://{ip}/")
+            async with client.stream("GET", f"http://{ip}/") as response:
+                server = response.headers.get("server", "").lower()
+                body = b""
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+                    if len(body) >= FINGERPRINT_SCAN_BYTES:
+                        break
             
-            content = response.text.lower()
-            headers = dict(response.headers)
-            server = headers.get("server", "").lower()
+            # Markers are ASCII, latin-1 maps bytes 1:1 without charset detection
+            content = body[:FINGERPRINT_SCAN_BYTES].decode("latin-1").lower()
             
-            # TP-Link detection
-            if "tp-link" in content or "tp-link" in server:
+            # Single pass over server header, then page body
+            match = FINGERPRINT_PATTERN.search(server) or FINGERPRINT_PATTERN.search(content)
+            if match:
+                device_type, manufacturer, capabilities = FINGERPRINTS[match.group(0)]
                 return DeviceInfo(
-                    device_type="tr069",
-                    manufacturer="TP-Link",
-                    ip_address=ip,
-                    capabilities=["wifi_config", "status", "reboot"]
-                )
-            
-            # D-Link detection
-            if "d-link" in content or "d-link" in server:
-                return DeviceInfo(
-                    device_type="tr069",
-                    manufacturer="D-Link",
-                    ip_address=ip,
-                    capabilities=["wifi_config", "status", "reboot"]
-                )
-            
-            # ASUS detection
-            if "asus" in content or "asuswrt" in content:
-                return DeviceInfo(
-                    device_type="asus",
-                    manufacturer="ASUS",
-                    ip_address=ip,
-                    capabilities=["wifi_config", "status"]
-                )
-            
-            # Ubiquiti detection
-            if "ubnt" in content or "ubiquiti" in content or "unifi" in content:
-                return DeviceInfo(
-                    device_type="ubiquiti",
-                    manufacturer="Ubiquiti",
+                    device_type=device_type,
+                    manufacturer=manufacturer,
                     ip_address=ip,
-                    capabilities=["status"]
+                    capabilities=list(capabilities)
                 )
                 
     except Exception:
@@ -181,25 +196,36 @@ async def detect_device(
     ip = request.gateway_ip
     logger.info("Device detection started", ip=ip, customer_id=token.customer_id)
     
-    # Run all detection methods concurrently
-    results = await asyncio.gather(
-        detect_starlink(ip),
-        detect_mikrotik(ip),
-        detect_tr069_device(ip),
-        detect_by_http_fingerprint(ip),
-        return_exceptions=True
-    )
+    # Run all detection methods concurrently, but take results in priority order:
+    # a detection wins only once every higher-priority detector has come up empty
+    tasks = [
+        asyncio.create_task(detector(ip))
+        for detector in (
+            detect_starlink,
+            detect_mikrotik,
+            detect_tr069_device,
+            detect_by_http_fingerprint,
+        )
+    ]
     
-    # Return first successful detection
-    for result in results:
-        if isinstance(result, DeviceInfo):
-            logger.info(
-                "Device detected",
-                device_type=result.device_type,
-                manufacturer=result.manufacturer,
-                ip=ip
-            )
-            return result
+    try:
+        for task in tasks:
+            try:
+                result = await task
+            except Exception:
+                continue
+            if isinstance(result, DeviceInfo):
+                logger.info(
+                    "Device detected",
+                    device_type=result.device_type,
+                    manufacturer=result.manufacturer,
+                    ip=ip
+                )
+                return result
+    finally:
+        # Stop the lower-priority probes once we have an answer
+        for task in tasks:
+            task.cancel()
     
     # No device detected
     logger.warning("No device detected", ip=ip)
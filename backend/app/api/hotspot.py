@@ -3,22 +3,35 @@ Hotspot Management API
 Unified hotspot management interface
 """
 
+from enum import Enum
+from types import MappingProxyType
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List, Mapping
 import structlog
 
 from app.api.auth import verify_token, TokenPayload
-from app.api.mikrotik import mikrotik_service, MikroTikCredentials, HotspotUser, VoucherRequest
+from app.api.mikrotik import (
+    mikrotik_service, MikroTikCredentials, HotspotUser, VoucherRequest, MAX_VOUCHERS_PER_REQUEST
+)
 
 router = APIRouter()
 logger = structlog.get_logger()
 
 
+class Preset(str, Enum):
+    """Quick voucher presets"""
+    HOUR = "1hour"
+    DAY = "1day"
+    WEEK = "1week"
+    MONTH = "1month"
+
+
 class QuickVoucher(BaseModel):
     """Quick voucher generation with presets"""
-    preset: str  # "1hour", "1day", "1week", "1month"
-    count: int = 1
+    preset: Preset
+    count: int = Field(1, ge=1, le=MAX_VOUCHERS_PER_REQUEST)
 
 
 class BulkVoucherPrint(BaseModel):
@@ -27,85 +40,48 @@ class BulkVoucherPrint(BaseModel):
     format: str = "thermal"  # "thermal", "a4", "card"
 
 
-VOUCHER_PRESETS = {
-    "1hour": {"profile": "1hour", "validity": "1h", "rate": "5M/5M"},
-    "1day": {"profile": "1day", "validity": "1d", "rate": "10M/10M"},
-    "1week": {"profile": "1week", "validity": "7d", "rate": "10M/10M"},
-    "1month": {"profile": "1month", "validity": "30d", "rate": "20M/20M"},
-}
-
+VOUCHER_PRESETS: Mapping[Preset, dict] = MappingProxyType({
+    Preset.HOUR: {"profile": "1hour", "validity": "1h", "rate": "5M/5M"},
+    Preset.DAY: {"profile": "1day", "validity": "1d", "rate": "10M/10M"},
+    Preset.WEEK: {"profile": "1week", "validity": "7d", "rate": "10M/10M"},
+    Preset.MONTH: {"profile": "1month", "validity": "30d", "rate": "20M/20M"},
+})
 
-@router.post("/quick-vouchers")
-async def generate_quick_vouchers(
-    creds: MikroTikCredentials,
-    request: QuickVoucher,
-    token: TokenPayload = Depends(verify_token)
-):
-    """
-    Generate vouchers using presets
-    Presets: 1hour, 1day, 1week, 1month
-    """
-    if request.preset not in VOUCHER_PRESETS:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Invalid preset. Available: {list(VOUCHER_PRESETS.keys())}"
-        )
-    
-    preset = VOUCHER_PRESETS[request.preset]
-    
-    logger.info(
-        "Generating quick vouchers",
-        preset=request.preset,
-        count=request.count,
-        customer_id=token.customer_id
+# Presets never change at runtime, build the voucher requests and listing once
+PRESET_REQUESTS: Mapping[Preset, VoucherRequest] = MappingProxyType({
+    k: VoucherRequest(
+        count=1,
+        profile=v["profile"],
+        validity=v["validity"],
+        prefix=k.value.upper()[:2]
     )
-    
-    voucher_request = VoucherRequest(
-        count=request.count,
-        profile=preset["profile"],
-        validity=preset["validity"],
-        prefix=request.preset.upper()[:2]
-    )
-    
-    vouchers = await mikrotik_service.generate_vouchers(creds, voucher_request)
-    
-    return {
-        "vouchers": vouchers,
-        "preset": request.preset,
-        "preset_details": preset
-    }
+    for k, v in VOUCHER_PRESETS.items()
+})
 
+PRESETS_RESPONSE = {
+    "presets": [
+        {"id": k.value, **v, "description": f"{k.value} access voucher"}
+        for k, v in VOUCHER_PRESETS.items()
+    ]
+}
 
-@router.post("/print-vouchers")
-async def format_vouchers_for_print(
-    request: BulkVoucherPrint,
-    token: TokenPayload = Depends(verify_token)
-):
-    """
-    Format vouchers for printing
-    Returns formatted HTML/text for different print formats
-    """
-    if request.format == "thermal":
-        # Format for 58mm thermal printer
-        output = []
-        for v in request.vouchers:
-            output.append(f"""
+
+# ==================== PRINT TEMPLATES ====================
+
+THERMAL_VOUCHER = """
 ================================
      WIFI VOUCHER
 ================================
-  Code: {v['code']}
-  Valid: {v.get('validity', 'N/A')}
-  Speed: {v.get('profile', 'Standard')}
+  Code: {code}
+  Valid: {validity}
+  Speed: {profile}
 --------------------------------
   Connect to: YOUR_WIFI_NAME
   Open browser, enter code
 ================================
-""")
-        return {"format": "text", "content": "\n".join(output)}
-    
-    elif request.format == "a4":
-        # Format for A4 paper (multiple vouchers per page)
-        html = """
+"""
+
+A4_HEADER = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -120,23 +96,21 @@ async def format_vouchers_for_print(
 <body>
 <div class="voucher-grid">
 """
-        for v in request.vouchers:
-            html += f"""
+
+A4_VOUCHER = """
 <div class="voucher">
     <div>WiFi Voucher</div>
-    <div class="code">{v['code']}</div>
+    <div class="code">{code}</div>
     <div class="details">
-        Valid for: {v.get('validity', 'N/A')}<br>
-        Speed: {v.get('profile', 'Standard')}
+        Valid for: {validity}<br>
+        Speed: {profile}
     </div>
 </div>
 """
-        html += "</div></body></html>"
-        return {"format": "html", "content": html}
-    
-    elif request.format == "card":
-        # Business card size format
-        html = """
+
+A4_FOOTER = "</div></body></html>"
+
+CARD_HEADER = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -148,29 +122,124 @@ async def format_vouchers_for_print(
 </head>
 <body>
 """
-        for v in request.vouchers:
-            html += f"""
+
+CARD_VOUCHER = """
 <div class="card">
     <h3>WiFi Access</h3>
-    <div class="code">{v['code']}</div>
-    <small>Valid: {v.get('validity', 'N/A')} | {v.get('profile', '')}</small>
+    <div class="code">{code}</div>
+    <small>Valid: {validity} | {profile}</small>
 </div>
 """
-        html += "</body></html>"
-        return {"format": "html", "content": html}
+
+CARD_FOOTER = "</body></html>"
+
+
+@router.post("/quick-vouchers")
+async def generate_quick_vouchers(
+    creds: MikroTikCredentials,
+    request: QuickVoucher,
+    token: TokenPayload = Depends(verify_token)
+):
+    """
+    Generate vouchers using presets
+    Presets: 1hour, 1day, 1week, 1month
+    """
+    preset = VOUCHER_PRESETS[request.preset]
+    
+    logger.info(
+        "Generating quick vouchers",
+        preset=request.preset.value,
+        count=request.count,
+        customer_id=token.customer_id
+    )
+    
+    voucher_request = PRESET_REQUESTS[request.preset].model_copy(update={"count": request.count})
+    
+    result = await mikrotik_service.generate_vouchers(creds, voucher_request)
+    
+    return {
+        **result,
+        "preset": request.preset,
+        "preset_details": preset
+    }
+
+
+# Vouchers rendered per streamed chunk
+PRINT_BATCH_SIZE = 100
+
+
+async def _thermal_chunks(vouchers: List[dict]):
+    """Yield 58mm thermal printer text in batches of vouchers"""
+    for start in range(0, len(vouchers), PRINT_BATCH_SIZE):
+        chunk = "\n".join(
+            THERMAL_VOUCHER.format(
+                code=v['code'],
+                validity=v.get('validity', 'N/A'),
+                profile=v.get('profile', 'Standard')
+            )
+            for v in vouchers[start:start + PRINT_BATCH_SIZE]
+        )
+        yield f"\n{chunk}" if start else chunk
+
+
+async def _html_chunks(header: str, template: str, footer: str, vouchers: List[dict], default_profile: str):
+    """Yield an HTML voucher sheet in batches of vouchers"""
+    yield header
+    for start in range(0, len(vouchers), PRINT_BATCH_SIZE):
+        yield "".join(
+            template.format(
+                code=v['code'],
+                validity=v.get('validity', 'N/A'),
+                profile=v.get('profile', default_profile)
+            )
+            for v in vouchers[start:start + PRINT_BATCH_SIZE]
+        )
+    yield footer
+
+
+@router.post("/print-vouchers")
+async def format_vouchers_for_print(
+    request: BulkVoucherPrint,
+    token: TokenPayload = Depends(verify_token)
+):
+    """
+    Format vouchers for printing
+    Streams formatted HTML/text for different print formats
+    """
+    if request.format not in ("thermal", "a4", "card"):
+        raise HTTPException(status_code=400, detail="Invalid format")
     
-    raise HTTPException(status_code=400, detail="Invalid format")
+    # Errors can't be reported once streaming starts, so check codes up front
+    if any('code' not in v for v in request.vouchers):
+        raise HTTPException(status_code=400, detail="Every voucher needs a code")
+    
+    if request.format == "thermal":
+        # Format for 58mm thermal printer
+        return StreamingResponse(_thermal_chunks(request.vouchers), media_type="text/plain")
+    
+    elif request.format == "a4":
+        # Format for A4 paper (multiple vouchers per page)
+        return StreamingResponse(
+            _html_chunks(A4_HEADER, A4_VOUCHER, A4_FOOTER, request.vouchers, 'Standard'),
+            media_type="text/html"
+        )
+    
+    # Business card size format
+    return StreamingResponse(
+        _html_chunks(CARD_HEADER, CARD_VOUCHER, CARD_FOOTER, request.vouchers, ''),
+        media_type="text/html"
+    )
 
 
 @router.get("/presets")
 async def get_voucher_presets(token: TokenPayload = Depends(verify_token)):
     """Get available voucher presets"""
-    return {
-        "presets": [
-            {"id": k, **v, "description": f"{k} access voucher"}
-            for k, v in VOUCHER_PRESETS.items()
-        ]
-    }
+    return PRESETS_RESPONSE
+
+
+def _bytes_to_mb(count: int) -> float:
+    """Convert bytes to MiB rounded to 2 decimals (integer math, one division)"""
+    return ((count * 100 + (1 << 19)) >> 20) / 100
 
 
 @router.post("/dashboard")
@@ -183,22 +252,23 @@ async def get_hotspot_dashboard(
     """
     logger.info("Getting hotspot dashboard", customer_id=token.customer_id)
     
-    # Get all data in parallel
-    import asyncio
-    users, active, profiles = await asyncio.gather(
-        mikrotik_service.get_hotspot_users(creds),
-        mikrotik_service.get_active_sessions(creds),
-        mikrotik_service.get_hotspot_profiles(creds)
-    )
+    # Get all data in parallel over one router session
+    users, active, profiles = await mikrotik_service.get_hotspot_overview(creds)
     
     # Calculate statistics
     total_users = len(users)
     active_sessions = len(active)
-    unused_vouchers = sum(1 for u in users if u.get('uptime', '0s') == '0s')
+    unused_vouchers = 0
+    for u in users:
+        if u.get('uptime', '0s') == '0s':
+            unused_vouchers += 1
     
     # Calculate bandwidth usage from active sessions
-    total_download = sum(int(s.get('bytes-in', 0)) for s in active)
-    total_upload = sum(int(s.get('bytes-out', 0)) for s in active)
+    # (pull the counter columns out once, then parse and sum them at C level)
+    bytes_in = [s.get('bytes-in', 0) for s in active]
+    bytes_out = [s.get('bytes-out', 0) for s in active]
+    total_download = sum(map(int, bytes_in))
+    total_upload = sum(map(int, bytes_out))
     
     return {
         "summary": {
@@ -210,8 +280,8 @@ async def get_hotspot_dashboard(
         "bandwidth": {
             "download_bytes": total_download,
             "upload_bytes": total_upload,
-            "download_mb": round(total_download / 1024 / 1024, 2),
-            "upload_mb": round(total_upload / 1024 / 1024, 2)
+            "download_mb": _bytes_to_mb(total_download),
+            "upload_mb": _bytes_to_mb(total_upload)
         },
         "active_sessions": active[:10],  # Return first 10
         "profiles": profiles
@@ -0,0 +1,63 @@
+"""
+Shared HTTP Clients
+Process-wide connection pools for upstream APIs
+"""
+
+import ssl
+import certifi
+import httpx
+
+from app.core.config import settings
+
+
+def _uisp_ssl_context() -> ssl.SSLContext:
+    """Build the TLS context shared by every UISP connection"""
+    if settings.UISP_VERIFY_SSL:
+        return ssl.create_default_context(cafile=settings.UISP_CA_BUNDLE or certifi.where())
+    
+    # Self-signed UISP installs are common, verification is opt-in
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+# UISP API client (keep-alive pool reused across requests, HTTP/2 multiplexed)
+uisp_client = httpx.AsyncClient(
+    base_url=settings.UISP_URL.rstrip('/') + "/api/v2.1",
+    verify=_uisp_ssl_context(),
+    timeout=30.0,
+    http2=True,
+    limits=httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=40,
+        keepalive_expiry=30.0
+    ),
+)
+
+# GenieACS NBI client (TR-069 reads and task submission). Connection failures
+# are retried by the transport; HTTP/2 is used when the NBI is served over TLS
+genieacs_client = httpx.AsyncClient(
+    base_url=settings.GENIEACS_URL.rstrip('/'),
+    timeout=httpx.Timeout(
+        connect=2.0,
+        read=settings.GENIEACS_TIMEOUT_READ,
+        write=5.0,
+        pool=2.0
+    ),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(
+            max_connections=settings.GENIEACS_MAX_CONNECTIONS,
+            max_keepalive_connections=50,
+            keepalive_expiry=30.0
+        ),
+    ),
+)
+
+
+async def close_clients():
+    """Close all shared HTTP clients"""
+    await uisp_client.aclose()
+    await genieacs_client.aclose()
@@ -4,18 +4,58 @@ Includes WiFi config and Hotspot management
 """
 
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
+from collections import defaultdict
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import hmac
+import secrets
+import string
+import time
 import structlog
-import routeros_api
 
 from app.api.auth import verify_token, TokenPayload
+from app.core.cache import cached, invalidate
+from app.core.config import settings
+from app.core.routeros import RouterOSApi, RouterOSError
 
 router = APIRouter()
 logger = structlog.get_logger()
-executor = ThreadPoolExecutor(max_workers=10)
+
+# Upper bound on vouchers created by one request
+MAX_VOUCHERS_PER_REQUEST = 1000
+
+# Marks voucher adds skipped because the router stalled
+_NOT_SENT = object()
+
+# Characters used in generated voucher codes
+VOUCHER_ALPHABET = string.ascii_uppercase + string.digits
+
+# Random byte -> alphabet character; bytes past the last whole multiple of the
+# alphabet size are dropped so every character is equally likely
+_VOUCHER_BYTE_LIMIT = 256 - 256 % len(VOUCHER_ALPHABET)
+_VOUCHER_TABLE = bytes(
+    ord(VOUCHER_ALPHABET[i % len(VOUCHER_ALPHABET)]) for i in range(256)
+)
+_VOUCHER_REJECT = bytes(range(_VOUCHER_BYTE_LIMIT, 256))
+
+
+def generate_voucher_codes(count: int, length: int, prefix: str = "") -> List[str]:
+    """Generate random voucher codes from one bulk CSPRNG draw"""
+    needed = count * length
+    chars = bytearray()
+    while len(chars) < needed:
+        raw = secrets.token_bytes(needed - len(chars) + 16)
+        chars += raw.translate(_VOUCHER_TABLE, _VOUCHER_REJECT)
+    
+    text = chars[:needed].decode('ascii')
+    return [prefix + text[i * length:(i + 1) * length] for i in range(count)]
+
+
+# Keyed so fingerprints in cache keys can't be brute-forced back to router passwords
+_fingerprint_key = settings.SECRET_KEY.encode()
 
 
 class MikroTikCredentials(BaseModel):
@@ -23,6 +63,12 @@ class MikroTikCredentials(BaseModel):
     username: str
     password: str
     port: int = 8728
+    
+    @property
+    def fingerprint(self) -> str:
+        """Key identifying this router login (keyed HMAC, safe to expose in Redis keys)"""
+        raw = f"{self.host}\0{self.port}\0{self.username}\0{self.password}"
+        return hmac.new(_fingerprint_key, raw.encode(), hashlib.sha256).hexdigest()
 
 
 class WifiSettings(BaseModel):
@@ -48,247 +94,402 @@ class HotspotProfile(BaseModel):
 
 
 class VoucherRequest(BaseModel):
-    count: int
+    count: int = Field(ge=1, le=MAX_VOUCHERS_PER_REQUEST)
     profile: str
     prefix: str = "V"
     validity: str = "1d"
     code_length: int = 8
 
 
+# Cache keys for read-mostly router data (per router login)
+PROFILES_CACHE_KEY = "mikrotik:{creds.fingerprint}:profiles"
+IFACES_CACHE_KEY = "mikrotik:{creds.fingerprint}:ifaces"
+
+
+def _retry_stale_session(method):
+    """
+    Evict a pooled session that timed out or dropped, then retry once on a fresh login.
+    Calls handed an explicit api session are left to their caller to retry.
+    """
+    @functools.wraps(method)
+    async def wrapper(self, creds: MikroTikCredentials, *args, **kwargs):
+        if kwargs.get("api") or any(isinstance(arg, RouterOSApi) for arg in args):
+            return await method(self, creds, *args, **kwargs)
+        
+        entry = self._pool.get(creds.fingerprint)
+        pooled = entry[0] if entry and entry[0].is_alive else None
+        try:
+            return await method(self, creds, *args, **kwargs)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            if pooled is None:
+                # A session we just logged in on failing means the router itself is down
+                await self._evict(creds.fingerprint)
+                raise
+            await self._evict(creds.fingerprint, pooled)
+            logger.warning("Stale MikroTik session, reconnecting", host=creds.host, error=repr(e))
+        
+        return await method(self, creds, *args, **kwargs)
+    
+    return wrapper
+
+
 class MikroTikService:
     """MikroTik RouterOS API Service"""
     
-    def _connect(self, creds: MikroTikCredentials):
-        """Create connection to MikroTik router"""
-        try:
-            connection = routeros_api.RouterOsApiPool(
-                host=creds.host,
-                username=creds.username,
-                password=creds.password,
-                port=creds.port,
-                plaintext_login=True
-            )
-            return connection.get_api()
-        except Exception as e:
-            logger.error("MikroTik connection failed", host=creds.host, error=str(e))
-            raise HTTPException(status_code=503, detail=f"Cannot connect to MikroTik: {str(e)}")
+    # Most voucher adds outstanding on one session at a time
+    VOUCHER_MAX_IN_FLIGHT = 32
+    
+    # Idle sessions are closed after POOL_IDLE_TIMEOUT, checked every POOL_SWEEP_INTERVAL
+    POOL_IDLE_TIMEOUT = 300
+    POOL_SWEEP_INTERVAL = 60
     
-    async def _run_sync(self, func, *args):
-        """Run synchronous function in executor"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(executor, func, *args)
+    def __init__(self):
+        self._pool: Dict[str, list] = {}  # fingerprint -> [api, last_used]
+        self._pool_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._sweeper: Optional[asyncio.Task] = None
+    
+    async def _get_api(self, creds: MikroTikCredentials) -> RouterOSApi:
+        """Get a pooled API session to the MikroTik router, logging in if needed"""
+        key = creds.fingerprint
+        
+        entry = self._pool.get(key)
+        if entry and entry[0].is_alive:
+            entry[1] = time.monotonic()
+            return entry[0]
+        
+        async with self._pool_locks[key]:
+            # Another request may have connected while we waited
+            entry = self._pool.get(key)
+            if entry and entry[0].is_alive:
+                entry[1] = time.monotonic()
+                return entry[0]
+            
+            try:
+                api = await RouterOSApi.connect(
+                    host=creds.host,
+                    username=creds.username,
+                    password=creds.password,
+                    port=creds.port
+                )
+            except Exception as e:
+                # Only logins that made it into the pool are cleaned up by the sweeper
+                if key not in self._pool:
+                    self._pool_locks.pop(key, None)
+                logger.error("MikroTik connection failed", host=creds.host, error=str(e))
+                raise HTTPException(status_code=503, detail=f"Cannot connect to MikroTik: {str(e)}")
+            
+            self._pool[key] = [api, time.monotonic()]
+        
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_idle())
+        
+        return api
+    
+    async def _evict(self, key: str, api: Optional[RouterOSApi] = None):
+        """Drop a router's pooled session (only if it is still api, when given) and close it"""
+        entry = self._pool.get(key)
+        if entry is None or (api is not None and entry[0] is not api):
+            if api is not None:
+                await api.close()
+            return
+        
+        del self._pool[key]
+        self._pool_locks.pop(key, None)
+        await entry[0].close()
+    
+    async def _sweep_idle(self):
+        """Periodically close sessions that have been idle too long"""
+        while self._pool:
+            await asyncio.sleep(self.POOL_SWEEP_INTERVAL)
+            cutoff = time.monotonic() - self.POOL_IDLE_TIMEOUT
+            for key, (api, last_used) in list(self._pool.items()):
+                if last_used < cutoff or not api.is_alive:
+                    del self._pool[key]
+                    self._pool_locks.pop(key, None)
+                    await api.close()
+    
+    async def close(self):
+        """Close all pooled sessions (application shutdown)"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        for api, _ in self._pool.values():
+            await api.close()
+        self._pool.clear()
+        self._pool_locks.clear()
     
     # ==================== SYSTEM ====================
     
+    @_retry_stale_session
     async def get_system_info(self, creds: MikroTikCredentials) -> dict:
         """Get router system information"""
-        def _get_info():
-            api = self._connect(creds)
-            resource = api.get_resource('/system/resource')
-            identity = api.get_resource('/system/identity')
-            routerboard = api.get_resource('/system/routerboard')
-            
-            return {
-                "resource": resource.get()[0] if resource.get() else {},
-                "identity": identity.get()[0] if identity.get() else {},
-                "routerboard": routerboard.get()[0] if routerboard.get() else {}
-            }
+        api = await self._get_api(creds)
+        resource = await api.get_resource('/system/resource').get()
+        identity = await api.get_resource('/system/identity').get()
+        routerboard = await api.get_resource('/system/routerboard').get()
         
-        return await self._run_sync(_get_info)
+        return {
+            "resource": resource[0] if resource else {},
+            "identity": identity[0] if identity else {},
+            "routerboard": routerboard[0] if routerboard else {}
+        }
     
+    @_retry_stale_session
     async def reboot(self, creds: MikroTikCredentials) -> bool:
         """Reboot the router"""
-        def _reboot():
-            api = self._connect(creds)
-            api.get_binary_resource('/').call('system/reboot')
-            return True
-        
-        return await self._run_sync(_reboot)
+        api = await self._get_api(creds)
+        try:
+            await api.get_resource('/system').call('reboot')
+        except ConnectionError:
+            # Router may drop the session before acknowledging
+            pass
+        return True
     
     # ==================== WIFI ====================
     
+    @_retry_stale_session
     async def get_wifi_settings(self, creds: MikroTikCredentials) -> dict:
         """Get WiFi interface settings"""
-        def _get_wifi():
-            api = self._connect(creds)
-            wireless = api.get_resource('/interface/wireless')
-            security = api.get_resource('/interface/wireless/security-profiles')
-            
-            return {
-                "interfaces": wireless.get(),
-                "security_profiles": security.get()
-            }
-        
-        return await self._run_sync(_get_wifi)
+        # Not cached: security profiles carry the WiFi passphrases in plaintext
+        api = await self._get_api(creds)
+        interfaces, security_profiles = await asyncio.gather(
+            api.get_resource('/interface/wireless').get(),
+            api.get_resource('/interface/wireless/security-profiles').get()
+        )
+        return {
+            "interfaces": interfaces,
+            "security_profiles": security_profiles
+        }
     
+    @_retry_stale_session
     async def set_wifi_password(self, creds: MikroTikCredentials, profile: str, password: str) -> bool:
         """Update WiFi password for a security profile"""
-        def _set_password():
-            api = self._connect(creds)
-            security = api.get_resource('/interface/wireless/security-profiles')
-            profiles = security.get(name=profile)
-            
-            if profiles:
-                security.set(
-                    id=profiles[0]['id'],
-                    **{'wpa2-pre-shared-key': password, 'wpa-pre-shared-key': password}
-                )
-                return True
-            return False
+        api = await self._get_api(creds)
+        security = api.get_resource('/interface/wireless/security-profiles')
+        profiles = await security.get(name=profile)
         
-        return await self._run_sync(_set_password)
+        if profiles:
+            await security.set(
+                id=profiles[0]['id'],
+                **{'wpa2-pre-shared-key': password, 'wpa-pre-shared-key': password}
+            )
+            return True
+        return False
     
+    @_retry_stale_session
     async def set_wifi_ssid(self, creds: MikroTikCredentials, interface: str, ssid: str) -> bool:
         """Update WiFi SSID"""
-        def _set_ssid():
-            api = self._connect(creds)
-            wireless = api.get_resource('/interface/wireless')
-            interfaces = wireless.get(name=interface)
-            
-            if interfaces:
-                wireless.set(id=interfaces[0]['id'], ssid=ssid)
-                return True
-            return False
+        api = await self._get_api(creds)
+        wireless = api.get_resource('/interface/wireless')
+        interfaces = await wireless.get(name=interface)
         
-        return await self._run_sync(_set_ssid)
+        if interfaces:
+            await wireless.set(id=interfaces[0]['id'], ssid=ssid)
+            return True
+        return False
+    
+    @cached(ttl=60, key=IFACES_CACHE_KEY)
+    @_retry_stale_session
+    async def get_wireless_interfaces(self, creds: MikroTikCredentials) -> List[dict]:
+        """Get wireless interface IDs and names"""
+        api = await self._get_api(creds)
+        interfaces = await api.get_resource('/interface/wireless').get()
+        return [{"id": i["id"], "name": i.get("name", "")} for i in interfaces]
+    
+    @_retry_stale_session
+    async def set_wifi_ssid_all(self, creds: MikroTikCredentials, ssid: str) -> int:
+        """Update the SSID on every wireless interface, returning how many were set"""
+        interfaces = await self.get_wireless_interfaces(creds)
+        api = await self._get_api(creds)
+        wireless = api.get_resource('/interface/wireless')
+        
+        try:
+            await asyncio.gather(*(
+                wireless.set(id=interface["id"], ssid=ssid)
+                for interface in interfaces
+            ))
+        except RouterOSError:
+            # Interface list may be stale (interface removed), refetch next time
+            await invalidate(IFACES_CACHE_KEY.format(creds=creds))
+            raise
+        
+        return len(interfaces)
     
     # ==================== HOTSPOT ====================
     
-    async def get_hotspot_users(self, creds: MikroTikCredentials) -> List[dict]:
+    @_retry_stale_session
+    async def get_hotspot_users(
+        self, 
+        creds: MikroTikCredentials, 
+        api: Optional[RouterOSApi] = None
+    ) -> List[dict]:
         """Get all hotspot users"""
-        def _get_users():
-            api = self._connect(creds)
-            users = api.get_resource('/ip/hotspot/user')
-            return users.get()
-        
-        return await self._run_sync(_get_users)
+        api = api or await self._get_api(creds)
+        return await api.get_resource('/ip/hotspot/user').get()
     
+    @_retry_stale_session
     async def create_hotspot_user(self, creds: MikroTikCredentials, user: HotspotUser) -> dict:
         """Create a new hotspot user"""
-        def _create_user():
-            api = self._connect(creds)
-            users = api.get_resource('/ip/hotspot/user')
-            
-            params = {
-                'name': user.username,
-                'password': user.password,
-                'profile': user.profile,
-            }
-            
-            if user.limit_uptime:
-                params['limit-uptime'] = user.limit_uptime
-            if user.limit_bytes_total:
-                params['limit-bytes-total'] = str(user.limit_bytes_total)
-            if user.comment:
-                params['comment'] = user.comment
-            
-            user_id = users.add(**params)
-            return {"id": user_id, "username": user.username}
+        params = {
+            'name': user.username,
+            'password': user.password,
+            'profile': user.profile,
+        }
+        
+        if user.limit_uptime:
+            params['limit-uptime'] = user.limit_uptime
+        if user.limit_bytes_total:
+            params['limit-bytes-total'] = str(user.limit_bytes_total)
+        if user.comment:
+            params['comment'] = user.comment
         
-        return await self._run_sync(_create_user)
+        api = await self._get_api(creds)
+        user_id = await api.get_resource('/ip/hotspot/user').add(**params)
+        return {"id": user_id, "username": user.username}
     
+    @_retry_stale_session
     async def delete_hotspot_user(self, creds: MikroTikCredentials, username: str) -> bool:
         """Delete a hotspot user"""
-        def _delete_user():
-            api = self._connect(creds)
-            users = api.get_resource('/ip/hotspot/user')
-            user_list = users.get(name=username)
-            
-            if user_list:
-                users.remove(id=user_list[0]['id'])
-                return True
-            return False
+        api = await self._get_api(creds)
+        users = api.get_resource('/ip/hotspot/user')
+        user_list = await users.get(name=username)
         
-        return await self._run_sync(_delete_user)
+        if user_list:
+            await users.remove(id=user_list[0]['id'])
+            return True
+        return False
     
+    @_retry_stale_session
     async def generate_vouchers(
         self, 
         creds: MikroTikCredentials, 
         request: VoucherRequest
-    ) -> List[dict]:
-        """Generate hotspot vouchers"""
-        import random
-        import string
+    ) -> dict:
+        """Generate hotspot vouchers
         
-        def _generate():
-            api = self._connect(creds)
-            users = api.get_resource('/ip/hotspot/user')
-            
-            vouchers = []
-            for i in range(request.count):
-                # Generate unique code
-                code = request.prefix + ''.join(
-                    random.choices(string.ascii_uppercase + string.digits, k=request.code_length)
-                )
-                
-                users.add(
-                    name=code,
-                    password=code,
-                    profile=request.profile,
-                    **{'limit-uptime': request.validity},
-                    comment=f"Voucher generated automatically"
-                )
-                
+        Returns created vouchers, the number of adds the router rejected, and
+        codes whose add timed out (they may still exist on the router).
+        """
+        # Generate all codes up front
+        codes = generate_voucher_codes(request.count, request.code_length, request.prefix)
+        
+        api = await self._get_api(creds)
+        users = api.get_resource('/ip/hotspot/user')
+        
+        # Pipeline adds on the one session, but cap how many are in flight so each
+        # command's timeout measures the router's response, not our queue
+        in_flight = asyncio.Semaphore(self.VOUCHER_MAX_IN_FLIGHT)
+        stalled = asyncio.Event()
+        
+        async def add(code: str):
+            async with in_flight:
+                # Once the router stops answering in time, don't queue more work on it
+                if stalled.is_set():
+                    return _NOT_SENT
+                try:
+                    return await users.add(
+                        name=code,
+                        password=code,
+                        profile=request.profile,
+                        **{'limit-uptime': request.validity},
+                        comment=f"Voucher generated automatically"
+                    )
+                except asyncio.TimeoutError:
+                    stalled.set()
+                    raise
+        
+        results = await asyncio.gather(*(add(code) for code in codes), return_exceptions=True)
+        
+        if stalled.is_set():
+            # Don't hand a session that stopped answering to the next request
+            await self._evict(creds.fingerprint, api)
+        
+        vouchers = []
+        unconfirmed = []
+        errors = []
+        for code, result in zip(codes, results):
+            if isinstance(result, asyncio.TimeoutError):
+                unconfirmed.append(code)
+            elif result is _NOT_SENT:
+                errors.append(asyncio.TimeoutError("Skipped after the router stopped responding"))
+            elif isinstance(result, Exception):
+                errors.append(result)
+            else:
                 vouchers.append({
                     "code": code,
                     "profile": request.profile,
                     "validity": request.validity
                 })
-            
-            return vouchers
         
-        return await self._run_sync(_generate)
+        if errors or unconfirmed:
+            logger.warning(
+                "Some vouchers failed to create",
+                host=creds.host,
+                failed=len(errors),
+                unconfirmed=len(unconfirmed),
+                error=repr(errors[0]) if errors else None
+            )
+            if not vouchers and not unconfirmed:
+                raise errors[0]
+        
+        return {"vouchers": vouchers, "failed": len(errors), "unconfirmed": unconfirmed}
     
-    async def get_active_sessions(self, creds: MikroTikCredentials) -> List[dict]:
+    @_retry_stale_session
+    async def get_active_sessions(
+        self, 
+        creds: MikroTikCredentials, 
+        api: Optional[RouterOSApi] = None
+    ) -> List[dict]:
         """Get active hotspot sessions"""
-        def _get_active():
-            api = self._connect(creds)
-            active = api.get_resource('/ip/hotspot/active')
-            return active.get()
-        
-        return await self._run_sync(_get_active)
+        api = api or await self._get_api(creds)
+        return await api.get_resource('/ip/hotspot/active').get()
     
+    @_retry_stale_session
     async def disconnect_session(self, creds: MikroTikCredentials, session_id: str) -> bool:
         """Disconnect an active hotspot session"""
-        def _disconnect():
-            api = self._connect(creds)
-            active = api.get_resource('/ip/hotspot/active')
-            active.remove(id=session_id)
-            return True
-        
-        return await self._run_sync(_disconnect)
+        api = await self._get_api(creds)
+        await api.get_resource('/ip/hotspot/active').remove(id=session_id)
+        return True
     
-    async def get_hotspot_profiles(self, creds: MikroTikCredentials) -> List[dict]:
+    @cached(ttl=30, key=PROFILES_CACHE_KEY)
+    @_retry_stale_session
+    async def get_hotspot_profiles(
+        self, 
+        creds: MikroTikCredentials, 
+        api: Optional[RouterOSApi] = None
+    ) -> List[dict]:
         """Get available hotspot profiles"""
-        def _get_profiles():
-            api = self._connect(creds)
-            profiles = api.get_resource('/ip/hotspot/user/profile')
-            return profiles.get()
-        
-        return await self._run_sync(_get_profiles)
+        api = api or await self._get_api(creds)
+        return await api.get_resource('/ip/hotspot/user/profile').get()
+    
+    @_retry_stale_session
+    async def get_hotspot_overview(self, creds: MikroTikCredentials):
+        """Get hotspot users, active sessions and profiles over one API session"""
+        api = await self._get_api(creds)
+        return await asyncio.gather(
+            self.get_hotspot_users(creds, api),
+            self.get_active_sessions(creds, api),
+            self.get_hotspot_profiles(creds, api)
+        )
     
+    @_retry_stale_session
     async def create_hotspot_profile(
         self, 
         creds: MikroTikCredentials, 
         profile: HotspotProfile
     ) -> dict:
         """Create a new hotspot user profile"""
-        def _create_profile():
-            api = self._connect(creds)
-            profiles = api.get_resource('/ip/hotspot/user/profile')
-            
-            profile_id = profiles.add(
-                name=profile.name,
-                **{
-                    'rate-limit': profile.rate_limit,
-                    'shared-users': str(profile.shared_users),
-                    'session-timeout': profile.session_timeout
-                }
-            )
-            
-            return {"id": profile_id, "name": profile.name}
+        api = await self._get_api(creds)
+        profile_id = await api.get_resource('/ip/hotspot/user/profile').add(
+            name=profile.name,
+            **{
+                'rate-limit': profile.rate_limit,
+                'shared-users': str(profile.shared_users),
+                'session-timeout': profile.session_timeout
+            }
+        )
         
-        return await self._run_sync(_create_profile)
+        await invalidate(PROFILES_CACHE_KEY.format(creds=creds))
+        return {"id": profile_id, "name": profile.name}
 
 
 mikrotik_service = MikroTikService()
@@ -342,9 +543,7 @@ async def update_wifi_settings(
     
     if settings.ssid:
         # Update SSID on all wireless interfaces
-        wifi = await mikrotik_service.get_wifi_settings(creds)
-        for interface in wifi.get("interfaces", []):
-            await mikrotik_service.set_wifi_ssid(creds, interface["name"], settings.ssid)
+        await mikrotik_service.set_wifi_ssid_all(creds, settings.ssid)
         results["ssid_updated"] = True
     
     logger.info("WiFi settings updated", host=creds.host, customer_id=token.customer_id)
@@ -398,8 +597,8 @@ async def generate_vouchers(
         profile=request.profile,
         customer_id=token.customer_id
     )
-    vouchers = await mikrotik_service.generate_vouchers(creds, request)
-    return {"vouchers": vouchers, "count": len(vouchers)}
+    result = await mikrotik_service.generate_vouchers(creds, request)
+    return {**result, "count": len(result["vouchers"])}
 
 
 @router.post("/hotspot/active")
@@ -9,11 +9,17 @@ from typing import Optional
 import structlog
 
 from app.api.auth import verify_token, TokenPayload
+from app.core.cache import cached, invalidate
 
 router = APIRouter()
 logger = structlog.get_logger()
 
 
+# Heavy dish reads, cached briefly so polling dashboards don't hammer the dish
+OBSTRUCTION_MAP_CACHE_KEY = "starlink:obstruction-map"
+HISTORY_CACHE_KEY = "starlink:history"
+
+
 class WifiSettings(BaseModel):
     ssid: Optional[str] = None
     password: Optional[str] = None
@@ -115,6 +121,7 @@ class StarlinkService:
             logger.error("Failed to unstow Starlink", error=str(e))
             raise HTTPException(status_code=503, detail=str(e))
     
+    @cached(ttl=5, key=OBSTRUCTION_MAP_CACHE_KEY)
     async def get_obstruction_map(self) -> dict:
         """Get obstruction map data"""
         try:
@@ -129,6 +136,7 @@ class StarlinkService:
             logger.error("Failed to get obstruction map", error=str(e))
             raise HTTPException(status_code=503, detail=str(e))
     
+    @cached(ttl=5, key=HISTORY_CACHE_KEY)
     async def get_history(self) -> dict:
         """Get connection history/statistics"""
         try:
@@ -203,3 +211,10 @@ async def get_obstruction_map(token: TokenPayload = Depends(verify_token)):
 async def get_history(token: TokenPayload = Depends(verify_token)):
     """Get connection history and statistics"""
     return await starlink_service.get_history()
+
+
+@router.post("/refresh")
+async def refresh_dish_data(token: TokenPayload = Depends(verify_token)):
+    """Drop cached obstruction map and history so the next read hits the dish"""
+    await invalidate(OBSTRUCTION_MAP_CACHE_KEY, HISTORY_CACHE_KEY)
+    return {"status": "refreshed"}
@@ -3,14 +3,17 @@ TR-069 Device Management API
 Supports D-Link, TP-Link, and other TR-069 compatible devices via GenieACS
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel
-from typing import Optional, List
-import httpx
+from cachetools import TTLCache
+from typing import Optional, List, Tuple
 import structlog
-import json
+import orjson
 
 from app.api.auth import verify_token, TokenPayload
+from app.api.http_clients import genieacs_client
+from app.core.cache import cached, invalidate
 from app.core.config import settings
 
 router = APIRouter()
@@ -30,50 +33,80 @@ class DeviceTask(BaseModel):
     device_id: str
 
 
+# Device document fields used by the device list
+LIST_PROJECTION = ["_id", "_deviceId", "_lastInform"]
+
+# Device document fields used by the status summary
+STATUS_PROJECTION = ["_id", "_deviceId", "_lastInform", "_registered"]
+
+# Cache keys for polled device reads
+STATUS_CACHE_KEY = "tr069:status:{device_id}"
+WIFI_CACHE_KEY = "tr069:wifi:{device_id}"
+
+# Device ID -> WiFi parameter paths; the data model (TR-098/TR-181) doesn't change
+_wifi_params_cache = TTLCache(maxsize=1024, ttl=3600)
+
+
 class TR069Service:
     """TR-069 ACS (GenieACS) Integration Service"""
     
     def __init__(self):
-        self.base_url = settings.GENIEACS_URL.rstrip('/')
+        # Caps in-flight NBI requests so parameter fan-out can't swamp GenieACS
+        self._semaphore = asyncio.Semaphore(settings.GENIEACS_MAX_CONCURRENCY)
     
     async def _request(self, method: str, path: str, **kwargs):
         """Make request to GenieACS NBI"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.request(
-                method,
-                f"{self.base_url}{path}",
-                **kwargs
+        async with self._semaphore:
+            response = await genieacs_client.request(method, path, **kwargs)
+        
+        if response.status_code >= 400:
+            logger.error("GenieACS request failed", 
+                       path=path, 
+                       status=response.status_code,
+                       response=response.text)
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"GenieACS error: {response.text}"
             )
-            
-            if response.status_code >= 400:
-                logger.error("GenieACS request failed", 
-                           path=path, 
-                           status=response.status_code,
-                           response=response.text)
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"GenieACS error: {response.text}"
-                )
-            
-            if response.text:
-                return response.json()
-            return None
-    
-    async def get_devices(self, query: dict = None) -> List[dict]:
-        """Get all TR-069 devices"""
+        
+        if response.content:
+            return orjson.loads(response.content)
+        return None
+    
+    async def _invalidate_device(self, device_id: str):
+        """Drop cached status and WiFi reads after a change is queued"""
+        await invalidate(
+            STATUS_CACHE_KEY.format(device_id=device_id),
+            WIFI_CACHE_KEY.format(device_id=device_id)
+        )
+    
+    async def get_devices(
+        self, 
+        query: dict = None, 
+        projection: Optional[List[str]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None
+    ) -> List[dict]:
+        """Get TR-069 devices, optionally projected and paged"""
         params = {}
         if query:
-            params["query"] = json.dumps(query)
+            params["query"] = orjson.dumps(query).decode()
+        if projection:
+            params["projection"] = ",".join(projection)
+        if skip:
+            params["skip"] = skip
+        if limit is not None:
+            params["limit"] = limit
         
         return await self._request("GET", "/devices", params=params)
     
-    async def get_device(self, device_id: str) -> dict:
-        """Get specific device by ID"""
-        devices = await self._request(
-            "GET", 
-            "/devices",
-            params={"query": json.dumps({"_id": device_id})}
-        )
+    async def get_device(self, device_id: str, projection: Optional[List[str]] = None) -> dict:
+        """Get specific device by ID, optionally only the projected fields"""
+        params = {"query": orjson.dumps({"_id": device_id}).decode()}
+        if projection:
+            params["projection"] = ",".join(projection)
+        
+        devices = await self._request("GET", "/devices", params=params)
         if devices:
             return devices[0]
         raise HTTPException(status_code=404, detail="Device not found")
@@ -82,16 +115,16 @@ class TR069Service:
         """Get specific parameters from device"""
         result = {}
         
-        for param in parameters:
-            try:
-                data = await self._request(
-                    "GET",
-                    f"/devices/{device_id}/parameters/{param}"
-                )
-                if data:
-                    result[param.split('.')[-1]] = data
-            except Exception as e:
-                logger.warning(f"Failed to get parameter {param}", error=str(e))
+        responses = await asyncio.gather(
+            *(self._request("GET", f"/devices/{device_id}/parameters/{param}") for param in parameters),
+            return_exceptions=True
+        )
+        
+        for param, data in zip(parameters, responses):
+            if isinstance(data, BaseException):
+                logger.warning(f"Failed to get parameter {param}", error=str(data))
+            elif data:
+                result[param.split('.')[-1]] = data
         
         return result
     
@@ -103,41 +136,60 @@ class TR069Service:
         connection_request: bool = True
     ) -> dict:
         """Set a device parameter via TR-069"""
+        return await self.set_device_parameters(
+            device_id,
+            [(parameter, value)],
+            connection_request=connection_request
+        )
+    
+    async def set_device_parameters(
+        self, 
+        device_id: str, 
+        pairs: List[Tuple[str, str]],
+        connection_request: bool = True
+    ) -> dict:
+        """Set several device parameters in one TR-069 task"""
         task = {
             "name": "setParameterValues",
-            "parameterValues": [[parameter, value, "xsd:string"]]
+            "parameterValues": [[name, value, "xsd:string"] for name, value in pairs]
         }
         
         params = {}
         if connection_request:
             params["connection_request"] = "true"
         
-        return await self._request(
+        result = await self._request(
             "POST",
             f"/devices/{device_id}/tasks",
             json=task,
             params=params
         )
+        await self._invalidate_device(device_id)
+        return result
     
     async def reboot_device(self, device_id: str) -> dict:
         """Reboot device via TR-069"""
         task = {"name": "reboot"}
-        return await self._request(
+        result = await self._request(
             "POST",
             f"/devices/{device_id}/tasks",
             json=task,
             params={"connection_request": "true"}
         )
+        await self._invalidate_device(device_id)
+        return result
     
     async def factory_reset(self, device_id: str) -> dict:
         """Factory reset device via TR-069"""
         task = {"name": "factoryReset"}
-        return await self._request(
+        result = await self._request(
             "POST",
             f"/devices/{device_id}/tasks",
             json=task,
             params={"connection_request": "true"}
         )
+        await self._invalidate_device(device_id)
+        return result
     
     async def refresh_device(self, device_id: str) -> dict:
         """Request device to refresh all parameters"""
@@ -154,7 +206,7 @@ class TR069Service:
         return await self._request(
             "GET",
             "/tasks",
-            params={"query": json.dumps({"device": device_id})}
+            params={"query": orjson.dumps({"device": device_id}).decode()}
         )
     
     async def delete_task(self, task_id: str) -> None:
@@ -187,17 +239,40 @@ class TR069Service:
             return self.WIFI_PARAMS["tr181"]
         return self.WIFI_PARAMS["default"]
     
-    async def get_wifi_settings(self, device_id: str) -> dict:
-        """Get WiFi settings from TR-069 device"""
-        device = await self.get_device(device_id)
+    async def _wifi_params_for(self, device_id: str, device: Optional[dict] = None) -> dict:
+        """WiFi parameter paths for a device, using the cached data model when known"""
+        if device is None:
+            params = _wifi_params_cache.get(device_id)
+            if params is not None:
+                return params
+            device = await self.get_device(device_id)
+        
         params = self._get_wifi_params(device)
+        _wifi_params_cache[device_id] = params
+        return params
+    
+    @cached(ttl=15, key=WIFI_CACHE_KEY)
+    async def _get_wifi_public_settings(self, device_id: str, params: dict) -> dict:
+        """WiFi parameters safe to cache (everything except the passphrase)"""
+        return await self.get_device_parameters(
+            device_id,
+            [path for name, path in params.items() if name != "password"]
+        )
+    
+    async def get_wifi_settings(self, device_id: str, device: Optional[dict] = None) -> dict:
+        """Get WiFi settings from TR-069 device"""
+        params = await self._wifi_params_for(device_id, device)
         
-        return await self.get_device_parameters(device_id, list(params.values()))
+        # The passphrase is always read live so it never lands in Redis
+        public, secret = await asyncio.gather(
+            self._get_wifi_public_settings(device_id, params),
+            self.get_device_parameters(device_id, [params["password"]])
+        )
+        return {**public, **secret}
     
-    async def set_wifi_ssid(self, device_id: str, ssid: str) -> dict:
+    async def set_wifi_ssid(self, device_id: str, ssid: str, device: Optional[dict] = None) -> dict:
         """Set WiFi SSID"""
-        device = await self.get_device(device_id)
-        params = self._get_wifi_params(device)
+        params = await self._wifi_params_for(device_id, device)
         
         return await self.set_device_parameter(
             device_id, 
@@ -205,10 +280,9 @@ class TR069Service:
             ssid
         )
     
-    async def set_wifi_password(self, device_id: str, password: str) -> dict:
+    async def set_wifi_password(self, device_id: str, password: str, device: Optional[dict] = None) -> dict:
         """Set WiFi password"""
-        device = await self.get_device(device_id)
-        params = self._get_wifi_params(device)
+        params = await self._wifi_params_for(device_id, device)
         
         return await self.set_device_parameter(
             device_id,
@@ -216,10 +290,9 @@ class TR069Service:
             password
         )
     
-    async def set_wifi_enabled(self, device_id: str, enabled: bool) -> dict:
+    async def set_wifi_enabled(self, device_id: str, enabled: bool, device: Optional[dict] = None) -> dict:
         """Enable/disable WiFi"""
-        device = await self.get_device(device_id)
-        params = self._get_wifi_params(device)
+        params = await self._wifi_params_for(device_id, device)
         
         return await self.set_device_parameter(
             device_id,
@@ -227,13 +300,18 @@ class TR069Service:
             "1" if enabled else "0"
         )
     
+    async def set_wifi_settings(self, device_id: str, values: dict, device: Optional[dict] = None) -> dict:
+        """Set several WiFi settings (ssid, password, enabled) in one task"""
+        params = await self._wifi_params_for(device_id, device)
+        
+        return await self.set_device_parameters(
+            device_id,
+            [(params[name], value) for name, value in values.items()]
+        )
+    
+    @cached(ttl=15, key=STATUS_CACHE_KEY)
     async def get_device_status(self, device_id: str) -> dict:
         """Get comprehensive device status"""
-        device = await self.get_device(device_id)
-        
-        # Extract useful info from device data
-        device_id_info = device.get("_deviceId", {})
-        
         # Try to get common status parameters
         status_params = [
             "InternetGatewayDevice.DeviceInfo.UpTime",
@@ -242,7 +320,14 @@ class TR069Service:
             "InternetGatewayDevice.LANDevice.1.LANHostConfigManagement.DHCPServerEnable",
         ]
         
-        status = await self.get_device_parameters(device_id, status_params)
+        # Only the summary fields are needed, fetched alongside the parameters
+        device, status = await asyncio.gather(
+            self.get_device(device_id, projection=STATUS_PROJECTION),
+            self.get_device_parameters(device_id, status_params)
+        )
+        
+        # Extract useful info from device data
+        device_id_info = device.get("_deviceId", {})
         
         return {
             "device_id": device.get("_id"),
@@ -262,14 +347,29 @@ tr069_service = TR069Service()
 
 @router.get("/devices")
 async def list_devices(
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
     token: TokenPayload = Depends(verify_token)
 ):
-    """List all TR-069 devices"""
-    logger.info("Listing TR-069 devices", customer_id=token.customer_id)
-    devices = await tr069_service.get_devices()
+    """
+    List TR-069 devices
+    Without limit returns the whole fleet as a list; with limit returns one page
+    as {"items", "skip", "limit", "next_skip"} (next_skip is null on the last page)
+    """
+    logger.info("Listing TR-069 devices", customer_id=token.customer_id, skip=skip, limit=limit)
+    devices = await tr069_service.get_devices(
+        projection=LIST_PROJECTION,
+        skip=skip,
+        # One extra row tells us whether another page exists
+        limit=limit + 1 if limit is not None else None
+    )
+    
+    has_more = limit is not None and len(devices) > limit
+    if has_more:
+        devices = devices[:limit]
     
     # Return simplified device list
-    return [
+    items = [
         {
             "device_id": d.get("_id"),
             "manufacturer": d.get("_deviceId", {}).get("_Manufacturer"),
@@ -279,6 +379,16 @@ async def list_devices(
         }
         for d in devices
     ]
+    
+    if limit is None:
+        return items
+    
+    return {
+        "items": items,
+        "skip": skip,
+        "limit": limit,
+        "next_skip": skip + limit if has_more else None
+    }
 
 
 @router.get("/devices/{device_id}")
@@ -318,19 +428,23 @@ async def update_wifi_settings(
     """Update WiFi settings"""
     logger.info("Updating WiFi settings", device_id=device_id, customer_id=token.customer_id)
     
-    tasks = []
+    values = {}
     
     if settings.ssid is not None:
-        task = await tr069_service.set_wifi_ssid(device_id, settings.ssid)
-        tasks.append({"parameter": "ssid", "task": task})
+        values["ssid"] = settings.ssid
     
     if settings.password is not None:
-        task = await tr069_service.set_wifi_password(device_id, settings.password)
-        tasks.append({"parameter": "password", "task": task})
+        values["password"] = settings.password
     
     if settings.enabled is not None:
-        task = await tr069_service.set_wifi_enabled(device_id, settings.enabled)
-        tasks.append({"parameter": "enabled", "task": task})
+        values["enabled"] = "1" if settings.enabled else "0"
+    
+    if not values:
+        return {"tasks": [], "message": "No settings to update"}
+    
+    # One setParameterValues task and one connection request for all changes
+    task = await tr069_service.set_wifi_settings(device_id, values)
+    tasks = [{"parameter": name, "task": task} for name in values]
     
     return {"tasks": tasks, "message": "Settings queued for device update"}
 
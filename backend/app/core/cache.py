@@ -0,0 +1,68 @@
+"""
+Redis Cache
+Short-lived caching for read-heavy device endpoints
+"""
+
+import functools
+import inspect
+import orjson
+import redis.asyncio as redis
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+# Tight timeouts so a Redis outage degrades to uncached calls, not stalls
+redis_client = redis.from_url(
+    settings.REDIS_URL,
+    socket_connect_timeout=0.5,
+    socket_timeout=0.5,
+)
+
+
+def cached(ttl: int, key: str):
+    """
+    Cache an async function's JSON-serializable result in Redis.
+    key is a str.format template over the function's arguments,
+    e.g. "mikrotik:{creds.fingerprint}:profiles".
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            cache_key = key.format(**bound.arguments)
+
+            try:
+                hit = await redis_client.get(cache_key)
+                if hit is not None:
+                    return orjson.loads(hit)
+            except Exception as e:
+                logger.warning("Cache read failed", key=cache_key, error=str(e))
+
+            result = await func(*args, **kwargs)
+
+            try:
+                await redis_client.set(cache_key, orjson.dumps(result), ex=ttl)
+            except Exception as e:
+                logger.warning("Cache write failed", key=cache_key, error=str(e))
+
+            return result
+
+        return wrapper
+    return decorator
+
+
+async def invalidate(*keys: str):
+    """Drop cached entries"""
+    try:
+        await redis_client.delete(*keys)
+    except Exception as e:
+        logger.warning("Cache invalidation failed", keys=keys, error=str(e))
+
+
+async def close_cache():
+    """Close the Redis connection pool"""
+    await redis_client.aclose()
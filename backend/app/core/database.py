@@ -4,22 +4,49 @@ Database Configuration and Connection
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON, Index, event, text
 from sqlalchemy.sql import func
+import time
+import structlog
+
 from app.core.config import settings
 
+logger = structlog.get_logger()
+
 
 # Convert sync URL to async
 database_url = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
 engine = create_async_engine(
     database_url,
-    echo=settings.ENVIRONMENT == "development",
+    echo=False,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=1800,
+    pool_timeout=10,
+    connect_args={
+        # Short OLTP queries never benefit from JIT compilation
+        "server_settings": {"jit": "off"},
+        "statement_cache_size": 1024,
+        "prepared_statement_cache_size": 1024,
+    },
 )
 
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    """Log only statements slower than SLOW_QUERY_MS instead of echoing everything"""
+    duration_ms = (time.perf_counter() - context._query_start) * 1000
+    if duration_ms > settings.SLOW_QUERY_MS:
+        logger.warning("Slow query", duration_ms=round(duration_ms, 1), statement=statement)
+
+
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -47,6 +74,10 @@ class Customer(Base):
 
 class CustomerDevice(Base):
     __tablename__ = "customer_devices"
+    __table_args__ = (
+        Index("idx_devices_customer_active", "customer_id", postgresql_where=text("is_active")),
+        Index("idx_devices_tr069", "tr069_device_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
@@ -85,9 +116,12 @@ class HotspotVoucher(Base):
 
 class UISPCache(Base):
     __tablename__ = "uisp_cache"
+    __table_args__ = (
+        Index("idx_cache_lookup", "uisp_customer_id", "data_type", "expires_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    uisp_customer_id = Column(String(255), nullable=False, index=True)
+    uisp_customer_id = Column(String(255), nullable=False)
     data_type = Column(String(50), nullable=False)  # invoices, services, profile
     data = Column(JSON, nullable=False)
     cached_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -96,6 +130,9 @@ class UISPCache(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        Index("idx_audit_customer_created", "customer_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"))
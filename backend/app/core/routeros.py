@@ -0,0 +1,270 @@
+"""
+RouterOS API Client
+Native asyncio implementation of the MikroTik API protocol
+"""
+
+import asyncio
+import itertools
+import socket
+from typing import Dict, List, Optional, Tuple
+
+
+class RouterOSError(Exception):
+    """Command rejected by the router (!trap)"""
+
+
+# TCP keepalive probing, so a half-open connection (NAT/firewall dropped it
+# without a FIN) is noticed in about two minutes rather than never
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 15
+KEEPALIVE_COUNT = 4
+
+
+def _enable_keepalive(writer: asyncio.StreamWriter) -> None:
+    """Turn on TCP keepalive for the connection's socket"""
+    sock = writer.get_extra_info("socket")
+    if sock is None:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Probe timings are platform-specific (Linux names shown)
+    for option, value in (
+        ("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+        ("TCP_KEEPCNT", KEEPALIVE_COUNT),
+    ):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def _encode_length(length: int) -> bytes:
+    """Encode a word length using the RouterOS variable-length scheme"""
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, "big")
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, "big")
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, "big")
+    return b"\xf0" + length.to_bytes(4, "big")
+
+
+def encode_sentence(words: List[str]) -> bytes:
+    """Encode a sentence (list of words) terminated by an empty word"""
+    parts = []
+    for word in words:
+        data = word.encode("utf-8")
+        parts.append(_encode_length(len(data)))
+        parts.append(data)
+    parts.append(b"\x00")
+    return b"".join(parts)
+
+
+def _parse_attributes(words: List[str]) -> dict:
+    """Parse =key=value words into a dict (.id is exposed as id)"""
+    attrs = {}
+    for word in words:
+        if not word.startswith("="):
+            continue
+        key, _, value = word[1:].partition("=")
+        attrs["id" if key == ".id" else key] = value
+    return attrs
+
+
+def _to_words(params: dict) -> List[str]:
+    """Convert keyword params into =key=value words (id is sent as .id)"""
+    return [f"={'.id' if key == 'id' else key}={value}" for key, value in params.items()]
+
+
+class RouterOSResource:
+    """Menu path on the router, e.g. /ip/hotspot/user"""
+
+    def __init__(self, api: "RouterOSApi", path: str):
+        self.api = api
+        self.path = path.rstrip("/")
+
+    async def get(self, **queries) -> List[dict]:
+        """Print all items, optionally filtered by exact-match queries"""
+        words = [f"{self.path}/print"]
+        words += [f"?{'.id' if key == 'id' else key}={value}" for key, value in queries.items()]
+        replies, _ = await self.api.talk(words)
+        return replies
+
+    async def add(self, **params) -> Optional[str]:
+        """Add an item, returning its new ID"""
+        _, done = await self.api.talk([f"{self.path}/add", *_to_words(params)])
+        return done.get("ret")
+
+    async def set(self, **params) -> None:
+        """Update an item (params must include id)"""
+        await self.api.talk([f"{self.path}/set", *_to_words(params)])
+
+    async def remove(self, id: str) -> None:
+        """Remove an item by ID"""
+        await self.api.talk([f"{self.path}/remove", f"=.id={id}"])
+
+    async def call(self, command: str, **params) -> List[dict]:
+        """Run an arbitrary command under this path"""
+        replies, _ = await self.api.talk([f"{self.path}/{command}", *_to_words(params)])
+        return replies
+
+
+class _PendingCommand:
+    """Replies collected for one tagged command"""
+
+    __slots__ = ("replies", "error", "future")
+
+    def __init__(self, future: asyncio.Future):
+        self.replies: List[dict] = []
+        self.error: Optional[str] = None
+        self.future = future
+
+
+class RouterOSApi:
+    """Single logged-in API session to a RouterOS device
+
+    Commands are tagged, so many can be in flight on one connection: each
+    caller writes its sentence immediately and a background reader routes
+    replies back by tag. Independent commands therefore pipeline instead of
+    waiting a full round-trip each.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float):
+        self._reader = reader
+        self._writer = writer
+        self._pending: Dict[str, _PendingCommand] = {}
+        self._tags = itertools.count()
+        self._read_task = asyncio.create_task(self._read_loop())
+        self.timeout = timeout
+        self.closed = False
+
+    @classmethod
+    async def connect(
+        cls,
+        host: str,
+        username: str,
+        password: str,
+        port: int = 8728,
+        timeout: float = 10.0
+    ) -> "RouterOSApi":
+        """Open a connection and log in (RouterOS 6.43+ plaintext login)"""
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port),
+            timeout
+        )
+        _enable_keepalive(writer)
+        api = cls(reader, writer, timeout)
+        try:
+            await api.talk(["/login", f"=name={username}", f"=password={password}"])
+        except BaseException:
+            await api.close()
+            raise
+        return api
+
+    @property
+    def is_alive(self) -> bool:
+        """Whether the session can still be used"""
+        return not self.closed and not self._reader.at_eof()
+
+    def get_resource(self, path: str) -> RouterOSResource:
+        """Get a resource wrapper for a menu path"""
+        return RouterOSResource(self, path)
+
+    async def talk(self, words: List[str]) -> Tuple[List[dict], dict]:
+        """Send a command and collect its replies until !done"""
+        if self.closed:
+            raise ConnectionError("RouterOS connection is closed")
+
+        tag = str(next(self._tags))
+        command = _PendingCommand(asyncio.get_running_loop().create_future())
+        self._pending[tag] = command
+
+        try:
+            self._writer.write(encode_sentence([*words, f".tag={tag}"]))
+            await self._writer.drain()
+            return await asyncio.wait_for(command.future, self.timeout)
+        finally:
+            # Late replies for an abandoned tag are simply discarded
+            self._pending.pop(tag, None)
+
+    async def _read_loop(self) -> None:
+        """Route incoming sentences to their pending command by tag"""
+        error: BaseException = ConnectionError("RouterOS connection closed")
+        try:
+            while True:
+                sentence = await self._read_sentence()
+                if not sentence:
+                    continue
+
+                reply_type = sentence[0]
+                if reply_type == "!fatal":
+                    message = sentence[1] if len(sentence) > 1 else "RouterOS fatal error"
+                    raise ConnectionError(message)
+
+                tag = next((w[5:] for w in sentence[1:] if w.startswith(".tag=")), None)
+                command = self._pending.get(tag)
+                if command is None or command.future.done():
+                    continue
+
+                attrs = _parse_attributes(sentence[1:])
+                if reply_type == "!re":
+                    command.replies.append(attrs)
+                elif reply_type == "!trap":
+                    command.error = attrs.get("message", "RouterOS command failed")
+                elif reply_type == "!done":
+                    if command.error is not None:
+                        command.future.set_exception(RouterOSError(command.error))
+                    else:
+                        command.future.set_result((command.replies, attrs))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self.closed = True
+            for command in self._pending.values():
+                if not command.future.done():
+                    command.future.set_exception(ConnectionError(str(error)))
+            self._writer.close()
+
+    async def _read_sentence(self) -> List[str]:
+        """Read words until the zero-length terminator"""
+        words = []
+        while True:
+            length = await self._read_length()
+            if length == 0:
+                return words
+            data = await self._readexactly(length)
+            words.append(data.decode("utf-8", errors="replace"))
+
+    async def _read_length(self) -> int:
+        """Decode a variable-length word length"""
+        first = (await self._readexactly(1))[0]
+
+        if first < 0x80:
+            return first
+        if first < 0xC0:
+            return int.from_bytes(bytes([first & 0x3F]) + await self._readexactly(1), "big")
+        if first < 0xE0:
+            return int.from_bytes(bytes([first & 0x1F]) + await self._readexactly(2), "big")
+        if first < 0xF0:
+            return int.from_bytes(bytes([first & 0x0F]) + await self._readexactly(3), "big")
+        return int.from_bytes(await self._readexactly(4), "big")
+
+    async def _readexactly(self, count: int) -> bytes:
+        try:
+            return await self._reader.readexactly(count)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("RouterOS connection closed by peer")
+
+    async def close(self) -> None:
+        """Close the connection"""
+        if self.closed and self._read_task.done():
+            return
+        self.closed = True
+        self._read_task.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except Exception:
+            pass
@@ -5,18 +5,42 @@ Supports: Starlink, MikroTik, TR-069 (D-Link/TP-Link), UISP Integration
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from contextlib import asynccontextmanager
+from cachetools import TTLCache
+from sqlalchemy import text
+import asyncio
+import orjson
 import structlog
 from prometheus_client import make_asgi_app
 
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import init_db, AsyncSessionLocal
+from app.core.cache import close_cache
+from app.api.http_clients import close_clients, genieacs_client
+from app.api.mikrotik import mikrotik_service
 from app.api import auth, devices, starlink, mikrotik, tr069, billing, hotspot
 
-# Configure structured logging
-structlog.configure(
-    processors=[
+def _orjson_dumps(obj, default=None) -> str:
+    """JSON serializer for structlog backed by orjson"""
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# Skip this module so stacks start at the logging call, not inside _error_details
+_stack_info_renderer = structlog.processors.StackInfoRenderer(additional_ignores=[__name__])
+
+
+def _error_details(logger, method_name, event_dict):
+    """Render stack and exception info only for events that carry them"""
+    if "exc_info" in event_dict or "stack_info" in event_dict:
+        event_dict = _stack_info_renderer(logger, method_name, event_dict)
+        event_dict = structlog.processors.format_exc_info(logger, method_name, event_dict)
+    return event_dict
+
+
+# Configure structured logging (full chain in development, lean chain otherwise)
+if settings.ENVIRONMENT == "development":
+    log_processors = [
         structlog.stdlib.filter_by_level,
         structlog.stdlib.add_logger_name,
         structlog.stdlib.add_log_level,
@@ -25,8 +49,21 @@ structlog.configure(
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
         structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
-    ],
+        structlog.processors.JSONRenderer(serializer=_orjson_dumps)
+    ]
+else:
+    log_processors = [
+        structlog.stdlib.filter_by_level,
+        structlog.stdlib.add_logger_name,
+        structlog.stdlib.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso"),
+        _error_details,
+        structlog.processors.UnicodeDecoder(),
+        structlog.processors.JSONRenderer(serializer=_orjson_dumps)
+    ]
+
+structlog.configure(
+    processors=log_processors,
     wrapper_class=structlog.stdlib.BoundLogger,
     context_class=dict,
     logger_factory=structlog.stdlib.LoggerFactory(),
@@ -45,6 +82,9 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     logger.info("Shutting down ISP Portal API")
+    await close_clients()
+    await mikrotik_service.close()
+    await close_cache()
 
 
 # Create FastAPI app
@@ -54,6 +94,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs" if settings.ENVIRONMENT != "production" else None,
     redoc_url="/redoc" if settings.ENVIRONMENT != "production" else None,
+    default_response_class=ORJSONResponse,
     lifespan=lifespan,
 )
 
@@ -87,14 +128,61 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
-# Health check endpoint
+# Health check endpoint (dependency probes memoized so LB polling stays cheap)
+HEALTH_CHECK_TIMEOUT = 0.5
+_health_cache = TTLCache(maxsize=1, ttl=2)
+
+
+async def _check_database() -> bool:
+    """Run SELECT 1 against the connection pool"""
+    async def ping():
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("SELECT 1"))
+    
+    try:
+        await asyncio.wait_for(ping(), HEALTH_CHECK_TIMEOUT)
+        return True
+    except Exception as e:
+        logger.warning("Database health check failed", error=str(e))
+        return False
+
+
+async def _check_genieacs() -> bool:
+    """Any HTTP response from the NBI means it is reachable"""
+    try:
+        await genieacs_client.head("/", timeout=HEALTH_CHECK_TIMEOUT)
+        return True
+    except Exception as e:
+        logger.warning("GenieACS health check failed", error=str(e))
+        return False
+
+
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy",
-        "service": "isp-portal-api",
-        "version": "1.0.0"
-    }
+    checks = _health_cache.get("checks")
+    if checks is None:
+        database, genieacs = await asyncio.gather(_check_database(), _check_genieacs())
+        checks = {"database": database, "genieacs": genieacs}
+        _health_cache["checks"] = checks
+    
+    # Only the database decides liveness: the container healthcheck and Traefik act on the
+    # status code, and a GenieACS outage must not take login and billing down with it
+    if not checks["database"]:
+        status = "unhealthy"
+    elif not checks["genieacs"]:
+        status = "degraded"
+    else:
+        status = "healthy"
+    
+    return ORJSONResponse(
+        status_code=503 if status == "unhealthy" else 200,
+        content={
+            "status": status,
+            "service": "isp-portal-api",
+            "version": "1.0.0",
+            "checks": checks
+        }
+    )
 
 
 # Include API routers
@@ -0,0 +1,142 @@
+"""
+RouterOS API client tests
+Drive RouterOSApi over an in-memory stream instead of a router
+"""
+
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from app.core.routeros import RouterOSApi, RouterOSError, _encode_length, encode_sentence
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeWriter:
+    """Collects everything the client sends"""
+
+    def __init__(self):
+        self.sent = bytearray()
+        self.closed = False
+
+    def write(self, data: bytes):
+        self.sent += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+@pytest_asyncio.fixture
+async def session():
+    reader = asyncio.StreamReader()
+    api = RouterOSApi(reader, FakeWriter(), timeout=1.0)
+    yield api, reader
+    await api.close()
+
+
+def reply(*words: str) -> bytes:
+    return encode_sentence(list(words))
+
+
+# Each pair is the last length of one encoding width and the first of the next
+LENGTH_BOUNDARIES = [
+    (0x7F, 1), (0x80, 2),
+    (0x3FFF, 2), (0x4000, 3),
+    (0x1FFFFF, 3), (0x200000, 4),
+    (0xFFFFFFF, 4), (0x10000000, 5),
+]
+
+
+@pytest.mark.parametrize("length, width", [(0, 1), *LENGTH_BOUNDARIES, (0xFFFFFFFF, 5)])
+async def test_length_round_trip(length, width):
+    encoded = _encode_length(length)
+    assert len(encoded) == width
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(encoded)
+    api = RouterOSApi.__new__(RouterOSApi)
+    api._reader = reader
+    assert await api._read_length() == length
+    reader.feed_eof()
+    assert await reader.read() == b""
+
+
+async def test_interleaved_tagged_replies(session):
+    api, reader = session
+    users = asyncio.create_task(api.talk(["/ip/hotspot/user/print"]))
+    interfaces = asyncio.create_task(api.talk(["/interface/wireless/print"]))
+    await asyncio.sleep(0)
+
+    reader.feed_data(
+        reply("!re", "=name=wlan1", ".tag=1")
+        + reply("!re", "=.id=*1", "=name=alice", ".tag=0")
+        + reply("!done", ".tag=1")
+        + reply("!re", "=.id=*2", "=name=bob", ".tag=0")
+        + reply("!done", ".tag=0")
+    )
+
+    assert await interfaces == ([{"name": "wlan1"}], {})
+    assert await users == ([{"id": "*1", "name": "alice"}, {"id": "*2", "name": "bob"}], {})
+    assert api._pending == {}
+
+
+async def test_trap_then_done_raises(session):
+    api, reader = session
+    command = asyncio.create_task(api.talk(["/ip/hotspot/user/add", "=name=alice"]))
+    await asyncio.sleep(0)
+
+    reader.feed_data(
+        reply("!trap", "=message=failure: already have user with this name", ".tag=0")
+        + reply("!done", ".tag=0")
+    )
+
+    with pytest.raises(RouterOSError, match="already have user"):
+        await command
+
+    # A rejected command leaves the session usable
+    follow_up = asyncio.create_task(api.talk(["/ip/hotspot/user/print"]))
+    await asyncio.sleep(0)
+    reader.feed_data(reply("!done", ".tag=1"))
+    assert await follow_up == ([], {})
+    assert api.is_alive
+
+
+async def test_late_reply_after_timeout_is_discarded(session):
+    api, reader = session
+    api.timeout = 0.05
+
+    with pytest.raises(asyncio.TimeoutError):
+        await api.talk(["/system/resource/print"])
+    assert api._pending == {}
+
+    # The router answers the abandoned tag after the next command was sent
+    command = asyncio.create_task(api.talk(["/system/identity/print"]))
+    await asyncio.sleep(0)
+    reader.feed_data(
+        reply("!re", "=uptime=1d", ".tag=0")
+        + reply("!done", ".tag=0")
+        + reply("!re", "=name=router", ".tag=1")
+        + reply("!done", ".tag=1")
+    )
+
+    assert await command == ([{"name": "router"}], {})
+    assert api.is_alive
+
+
+async def test_fatal_fails_pending_commands(session):
+    api, reader = session
+    command = asyncio.create_task(api.talk(["/system/resource/print"]))
+    await asyncio.sleep(0)
+
+    reader.feed_data(reply("!fatal", "session terminated on request"))
+
+    with pytest.raises(ConnectionError, match="session terminated"):
+        await command
+    assert not api.is_alive
@@ -44,6 +44,8 @@ CREATE TABLE IF NOT EXISTS customer_devices (
 
 CREATE INDEX idx_devices_customer ON customer_devices(customer_id);
 CREATE INDEX idx_devices_type ON customer_devices(device_type);
+CREATE INDEX idx_devices_customer_active ON customer_devices(customer_id) WHERE is_active;
+CREATE INDEX idx_devices_tr069 ON customer_devices(tr069_device_id);
 
 -- Hotspot vouchers table
 CREATE TABLE IF NOT EXISTS hotspot_vouchers (
@@ -70,7 +72,7 @@ CREATE TABLE IF NOT EXISTS uisp_cache (
     expires_at TIMESTAMP WITH TIME ZONE NOT NULL
 );
 
-CREATE INDEX idx_cache_customer ON uisp_cache(uisp_customer_id);
+CREATE INDEX idx_cache_lookup ON uisp_cache(uisp_customer_id, data_type, expires_at);
 CREATE INDEX idx_cache_type ON uisp_cache(data_type);
 CREATE INDEX idx_cache_expires ON uisp_cache(expires_at);
 
@@ -86,7 +88,7 @@ CREATE TABLE IF NOT EXISTS audit_logs (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX idx_audit_customer ON audit_logs(customer_id);
+CREATE INDEX idx_audit_customer_created ON audit_logs(customer_id, created_at);
 CREATE INDEX idx_audit_action ON audit_logs(action);
 CREATE INDEX idx_audit_created ON audit_logs(created_at);
 